@@ -1,50 +1,145 @@
 import streamlit as st
 import pandas as pd
-import joblib
+import numpy as np
 import plotly.express as px
-from fpdf import FPDF
+import plotly.graph_objects as go
 import os
+import io
+import hashlib
+from feature_engineer import COUNT_COLUMNS, default_features_path, read_features, run_feature_engineering_from_files
+from model_io import load_model as _load_model
+from pdf_report import generate_pdf
+
+# Anomaly labels, in code order: IsolationForest predicts 1 (Normal) or -1 (Suspicious)
+STATUS_CATEGORIES = ['Normal', 'Suspicious']
+
+# Rows of the filtered table rendered in the browser
+PREVIEW_ROWS = 1000
+
+@st.cache_data(show_spinner=False, max_entries=4)
+def engineer_features(logon_bytes: bytes, http_bytes: bytes, device_bytes: bytes):
+    # Takes raw file bytes so the cache is keyed on file content
+    return run_feature_engineering_from_files(
+        io.BytesIO(logon_bytes), io.BytesIO(http_bytes), io.BytesIO(device_bytes)
+    )
 
-# Feature Engineering Helper
-def run_feature_engineering_from_files(logon_file, http_file, device_file):
-    # logon and device: default headers
-    logon_counts = pd.read_csv(logon_file)['user'].value_counts().rename('logon_count') if logon_file else pd.Series(dtype=int)
-    device_counts = pd.read_csv(device_file)['user'].value_counts().rename('device_count') if device_file else pd.Series(dtype=int)
-    # http file: manually set columns
-    http_cols = ['id', 'date', 'user', 'pc', 'url']
-    http_counts = pd.read_csv(http_file, header=None, names=http_cols)['user'].value_counts().rename('http_count') if http_file else pd.Series(dtype=int)
-    # Merge counts
-    features = pd.concat([logon_counts, http_counts, device_counts], axis=1).fillna(0).astype(int)
-    features.index.name = "user"
-    return features
+@st.cache_data(show_spinner=False)
+def load_default_features(path, mtime):
+    # mtime is part of the cache key so an updated file is re-read
+    return read_features(path)
 
 @st.cache_data
 def load_model():
-    return joblib.load('model_store/iforest_model.joblib')
-
-def color_status(val):
-    return ''  # No styling for now
-
-def generate_pdf(df: pd.DataFrame) -> bytes:
-    pdf = FPDF()
-    pdf.add_page()
-    pdf.set_font("Arial", size=12)
-    pdf.cell(200, 10, txt="Insider Threat Detection Report", ln=True, align='C')
-    pdf.ln(10)
-    # Table header
-    headers = ["User", "logon_count", "http_count", "device_count", "status"]
-    for h in headers:
-        pdf.cell(38, 10, h, border=1)
-    pdf.ln()
-    # Table rows (first 50 rows)
-    for user, row in df.head(50).iterrows():
-        pdf.cell(38, 10, str(user), border=1)
-        pdf.cell(38, 10, str(row["logon_count"]), border=1)
-        pdf.cell(38, 10, str(row["http_count"]), border=1)
-        pdf.cell(38, 10, str(row["device_count"]), border=1)
-        pdf.cell(38, 10, row["status"], border=1)
-        pdf.ln()
-    return pdf.output(dest='S').encode('latin1')
+    return _load_model()
+
+@st.cache_data(show_spinner=False)
+def predict_anomaly(features_hash: str, _features: pd.DataFrame) -> np.ndarray:
+    # Cached on features_hash; the leading underscore keeps the frame itself out of the key
+    model = load_model()
+    if hasattr(model, 'feature_names_in_'):
+        # Models fitted on a DataFrame check column names; select their columns
+        # by name, in fit order, so predict is warning-free and never mislabelled
+        X = _features[list(model.feature_names_in_)].astype(np.float32)
+    else:
+        # Hand the model one contiguous float32 matrix, the dtype its trees use
+        X = np.ascontiguousarray(_features[COUNT_COLUMNS].to_numpy(dtype=np.float32))
+    return model.predict(X)
+
+@st.cache_data(show_spinner=False)
+def column_ranges(features_hash: str, _features: pd.DataFrame) -> pd.DataFrame:
+    # Min/max of each count column, computed once per features table for the sliders
+    return _features[COUNT_COLUMNS].agg(['min', 'max']).astype(int)
+
+def hash_features(features: pd.DataFrame) -> str:
+    row_hashes = pd.util.hash_pandas_object(features, index=True).to_numpy()
+    return hashlib.blake2b(row_hashes.tobytes(), digest_size=16).hexdigest()
+
+@st.cache_data(show_spinner=False)
+def build_pie(counts: tuple) -> dict:
+    # Keyed on the (status, count) pairs so unchanged distributions reuse the figure
+    status_counts = pd.DataFrame(list(counts), columns=['Status', 'Count'])
+    fig_pie = px.pie(
+        status_counts,
+        values='Count', names='Status',
+        color='Status', color_discrete_map={'Normal': '#82E0AA', 'Suspicious': '#F1948A'}
+    )
+    fig_pie.update_traces(textposition='inside', textinfo='percent+label', hoverinfo='label+percent')
+    fig_pie.update_layout(width=450, height=450, title_text=None, showlegend=True)
+    return fig_pie.to_dict()
+
+@st.fragment
+def filter_view(features: pd.DataFrame, ranges: pd.DataFrame):
+    # Widget changes in here rerun only this fragment, not the load/predict above
+    with st.expander("Filters", expanded=True):
+        col1, col2, col3 = st.columns(3)
+        min_logon, max_logon = col1.slider(
+            "Logon Count",
+            int(ranges.at['min', 'logon_count']), int(ranges.at['max', 'logon_count']),
+            (int(ranges.at['min', 'logon_count']), int(ranges.at['max', 'logon_count']))
+        )
+        min_http, max_http = col2.slider(
+            "HTTP Count",
+            int(ranges.at['min', 'http_count']), int(ranges.at['max', 'http_count']),
+            (int(ranges.at['min', 'http_count']), int(ranges.at['max', 'http_count']))
+        )
+        min_device, max_device = col3.slider(
+            "Device Count",
+            int(ranges.at['min', 'device_count']), int(ranges.at['max', 'device_count']),
+            (int(ranges.at['min', 'device_count']), int(ranges.at['max', 'device_count']))
+        )
+        status_filter = st.multiselect(
+            "Anomaly Status", options=STATUS_CATEGORIES,
+            default=STATUS_CATEGORIES
+        )
+    # Filtered Data: build one boolean mask over the raw column arrays
+    lc = features['logon_count'].to_numpy()
+    hc = features['http_count'].to_numpy()
+    dc = features['device_count'].to_numpy()
+    status_codes = features['status'].cat.codes.to_numpy()
+    mask = np.logical_and.reduce([
+        lc >= min_logon, lc <= max_logon,
+        hc >= min_http, hc <= max_http,
+        dc >= min_device, dc <= max_device,
+        np.isin(status_codes, [STATUS_CATEGORIES.index(s) for s in status_filter])
+    ])
+    filtered = features.iloc[mask]
+
+    st.write(f"### Filtered Users ({len(filtered)})")
+    # Only ship a bounded preview to the browser; the full table is downloadable
+    st.dataframe(filtered[COUNT_COLUMNS + ['status']].head(PREVIEW_ROWS))
+    if len(filtered) > PREVIEW_ROWS:
+        st.caption(f"Showing first {PREVIEW_ROWS} of {len(filtered)}")
+    if not filtered.empty:
+        st.download_button(
+            label="Download filtered CSV",
+            # A callable is only evaluated when the button is clicked
+            data=lambda: filtered[COUNT_COLUMNS + ['status']].to_csv().encode(),
+            file_name="filtered_users.csv",
+            mime="text/csv"
+        )
+
+    # Bar Chart
+    st.write("### Activity Counts Summary")
+    summary = filtered[['logon_count', 'http_count', 'device_count']].sum()
+    st.bar_chart(summary)
+
+    # Pie Chart
+    st.write("### Anomaly Status Distribution")
+    # Status is a two-category code array, so its distribution is a bincount over the mask
+    counts = np.bincount(status_codes[mask], minlength=len(STATUS_CATEGORIES))
+    counts_key = tuple((status, count) for status, count in zip(STATUS_CATEGORIES, counts.tolist()) if count)
+    st.plotly_chart(go.Figure(build_pie(counts_key)), key="pie_chart")
+
+    # PDF Download
+    if not filtered.empty:
+        report_rows = filtered.head(50)
+        st.download_button(
+            label="Download PDF",
+            # A callable is only evaluated when the button is clicked
+            data=lambda: generate_pdf(report_rows),
+            file_name="insider_threat_report.pdf",
+            mime="application/pdf"
+        )
 
 def main():
     st.title("Insider Threat Detection Dashboard")
@@ -62,7 +157,7 @@ def main():
     if uploaded_files:
         if len(uploaded_files) == 1 and 'feature' in uploaded_files[0].name.lower():
             st.success("Structured features file detected.")
-            features = pd.read_csv(uploaded_files[0], index_col=0)
+            features = pd.read_csv(uploaded_files[0], index_col=0, engine='pyarrow')
             required_cols = {'logon_count', 'http_count', 'device_count'}
             if set(features.columns) < required_cols:
                 st.error(f"CSV missing required columns: {', '.join(required_cols - set(features.columns))}")
@@ -76,78 +171,23 @@ def main():
                 st.warning("If uploading raw data, you must provide all three: logon.csv, http.csv, device.csv.")
             else:
                 st.success("Raw log files detected: running feature engineering...")
-                features = run_feature_engineering_from_files(logon_file, http_file, device_file)
+                features = engineer_features(
+                    logon_file.getvalue(), http_file.getvalue(), device_file.getvalue()
+                )
     else:
         st.info("No upload detected, showing default data")
-        root_path = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
-        features_path = os.path.join(root_path, 'features.csv')
-        features = pd.read_csv(features_path, index_col=0)
+        features_path = default_features_path()
+        features = load_default_features(features_path, os.path.getmtime(features_path))
 
     if features is not None:
-        model = load_model()
-        preds = model.predict(features)
-        features['anomaly'] = preds
-        features['status'] = features['anomaly'].map({1:'Normal', -1:'Suspicious'})
-
-        with st.expander("Filters", expanded=True):
-            col1, col2, col3 = st.columns(3)
-            min_logon, max_logon = col1.slider(
-                "Logon Count",
-                int(features['logon_count'].min()), int(features['logon_count'].max()),
-                (int(features['logon_count'].min()), int(features['logon_count'].max()))
-            )
-            min_http, max_http = col2.slider(
-                "HTTP Count",
-                int(features['http_count'].min()), int(features['http_count'].max()),
-                (int(features['http_count'].min()), int(features['http_count'].max()))
-            )
-            min_device, max_device = col3.slider(
-                "Device Count",
-                int(features['device_count'].min()), int(features['device_count'].max()),
-                (int(features['device_count'].min()), int(features['device_count'].max()))
-            )
-            status_filter = st.multiselect(
-                "Anomaly Status", options=['Normal', 'Suspicious'],
-                default=['Normal', 'Suspicious']
-            )
-        # Filtered Data
-        filtered = features[
-            (features['logon_count'] >= min_logon) & (features['logon_count'] <= max_logon) &
-            (features['http_count'] >= min_http) & (features['http_count'] <= max_http) &
-            (features['device_count'] >= min_device) & (features['device_count'] <= max_device) &
-            (features['status'].isin(status_filter))
-        ]
-
-        st.write(f"### Filtered Users ({len(filtered)})")
-        st.dataframe(filtered[['logon_count','http_count','device_count','status']])
-
-        # Bar Chart
-        st.write("### Activity Counts Summary")
-        summary = filtered[['logon_count', 'http_count', 'device_count']].sum()
-        st.bar_chart(summary)
-
-        # Pie Chart
-        st.write("### Anomaly Status Distribution")
-        status_counts = filtered['status'].value_counts().reset_index()
-        status_counts.columns = ['Status', 'Count']
-        fig_pie = px.pie(
-            status_counts,
-            values='Count', names='Status',
-            color='Status', color_discrete_map={'Normal': '#82E0AA', 'Suspicious': '#F1948A'}
-        )
-        fig_pie.update_traces(textposition='inside', textinfo='percent+label', hoverinfo='label+percent')
-        fig_pie.update_layout(width=450, height=450, title_text=None, showlegend=True)
-        st.plotly_chart(fig_pie, key="pie_chart")
-
-        # PDF Download
-        if not filtered.empty:
-            pdf_bytes = generate_pdf(filtered)
-            st.download_button(
-                label="Download PDF",
-                data=pdf_bytes,
-                file_name="insider_threat_report.pdf",
-                mime="application/pdf"
-            )
+        # Narrow counts to int32; predict_anomaly builds the float32 model input
+        features = features.astype({col: np.int32 for col in COUNT_COLUMNS})
+        features_hash = hash_features(features)
+        preds = predict_anomaly(features_hash, features)
+        ranges = column_ranges(features_hash, features)
+        features['status'] = pd.Categorical.from_codes((preds == -1).astype(np.int8), categories=STATUS_CATEGORIES)
+
+        filter_view(features, ranges)
 
 if __name__ == "__main__":
     main()
@@ -1,40 +1,169 @@
+import numpy as np
+import pyarrow as pa
+import pyarrow.csv as pacsv
 import pandas as pd
 import os
+import argparse
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
 
-def load_and_aggregate(file_path, user_col='user', header='infer', names=None):
-    df = pd.read_csv(file_path, header=header, names=names)
-    counts = df[user_col].value_counts().rename(f'{os.path.basename(file_path).replace(".csv","")}_count')
+COUNT_COLUMNS = ['logon_count', 'http_count', 'device_count']
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+FEATURES_PARQUET = os.path.join(ROOT_DIR, 'features.parquet')
+USERS_PARQUET = os.path.join(ROOT_DIR, 'users.parquet')
+FEATURES_CSV = os.path.join(ROOT_DIR, 'features.csv')
+
+# Per-file user counts cached as Parquet, keyed on path, size and mtime
+CACHE_DIR = os.path.join(ROOT_DIR, '.cache')
+# Bump when the counting semantics change so stale cache entries are not reused
+CACHE_VERSION = 2
+
+# Size in bytes of each block read from the raw logs
+BLOCK_SIZE = 16 << 20
+
+# Number of per-block count tables to buffer before folding them together
+MERGE_EVERY = 32
+
+def _count_name(file_path):
+    # e.g. 'logon_count' for logon.csv; file objects use their .name if they have one
+    path = file_path if isinstance(file_path, str) else getattr(file_path, 'name', None)
+    if not isinstance(path, str):
+        return 'count'
+    return os.path.splitext(os.path.basename(path))[0] + '_count'
+
+def load_and_aggregate(file_path, *, user_col='user', header='infer', names=None, out_name=None):
+    # Count rows per user in one log; file_path may be a path or a file object.
+    # Callers that know the column name pass out_name so no path parsing happens.
+    name = out_name or _count_name(file_path)
+    if not file_path:
+        return pd.Series(dtype=int, name=name)
+    # Map pandas' header/names conventions onto pyarrow's reader: header=n skips
+    # the n rows above the header row (and the header row too when names replace it)
+    if header == 'infer':
+        header = None if names is not None else 0
+    if header is not None and (isinstance(header, bool) or not isinstance(header, int)):
+        raise ValueError(f"unsupported header={header!r}; use 'infer', None or a row number")
+    skip_rows = 0 if header is None else header + (names is not None)
+    autogenerate = header is None and names is None
+    if autogenerate and isinstance(user_col, int):
+        # positional column, as pandas allows without names; pyarrow calls it f<i>
+        user_col = f'f{user_col}'
+    if not isinstance(file_path, str):
+        return _stream_count_user(file_path, name, names, user_col, autogenerate, skip_rows)
+
+    # Raw log on disk: reuse the counts cached for this exact file version
+    stat = os.stat(file_path)
+    key = hashlib.md5(
+        f'{CACHE_VERSION}|{os.path.abspath(file_path)}|{stat.st_size}|{stat.st_mtime_ns}|{user_col}|{names}|{autogenerate}|{skip_rows}'.encode()
+    ).hexdigest()
+    cache_path = os.path.join(CACHE_DIR, f'{key}.parquet')
+    if os.path.exists(cache_path):
+        return pd.read_parquet(cache_path).iloc[:, 0].rename(name)
+    # Memory-map the log so blocks are read straight from the page cache
+    with pa.memory_map(file_path) as source:
+        counts = _stream_count_user(source, name, names, user_col, autogenerate, skip_rows)
+    os.makedirs(CACHE_DIR, exist_ok=True)
+    tmp_path = f'{cache_path}.{os.getpid()}.tmp'
+    counts.to_frame().to_parquet(tmp_path)
+    os.replace(tmp_path, cache_path)
     return counts
 
+def _merge_counts(partials):
+    # Sum per-block (user, n) tables with Arrow's multithreaded hash aggregation
+    totals = pa.concat_tables(partials).group_by('user').aggregate([('n', 'sum')])
+    # select by name: the column order of group_by output differs across pyarrow releases
+    return pa.table({'user': totals['user'], 'n': totals['n_sum']})
+
+def _stream_count_user(file, name, names, user_col, autogenerate, skip_rows=0):
+    # Stream the user column block by block, dictionary-encoded, folding the
+    # per-block counts into a running table every MERGE_EVERY blocks, so peak
+    # memory is bounded by one block plus MERGE_EVERY small count tables
+    read_options = pacsv.ReadOptions(column_names=names, autogenerate_column_names=autogenerate,
+                                      skip_rows=skip_rows, use_threads=True, block_size=BLOCK_SIZE)
+    convert_options = pacsv.ConvertOptions(
+        include_columns=[user_col],
+        column_types={user_col: pa.dictionary(pa.int32(), pa.string())},
+        # blank/NA cells are missing users, as with pandas' value_counts
+        strings_can_be_null=True
+    )
+    partials = []
+    for batch in pacsv.open_csv(file, read_options=read_options, convert_options=convert_options):
+        arr = batch.column(0)
+        counts = np.bincount(arr.drop_null().indices.to_numpy(), minlength=len(arr.dictionary))
+        partials.append(pa.table({'user': arr.dictionary.cast(pa.string()), 'n': counts}))
+        if len(partials) > MERGE_EVERY:
+            partials = [_merge_counts(partials)]
+    if not partials:
+        return pd.Series(dtype=int, name=name)
+    totals = _merge_counts(partials)
+    return pd.Series(totals.column('n').to_numpy(), index=pd.Index(totals.column('user').to_pylist()), name=name)
+
 def run_feature_engineering_from_files(logon_file, http_file, device_file):
-    # logon and device: default headers
-    logon_counts = pd.read_csv(logon_file)['user'].value_counts().rename('logon_count') if logon_file else pd.Series(dtype=int)
-    device_counts = pd.read_csv(device_file)['user'].value_counts().rename('device_count') if device_file else pd.Series(dtype=int)
-    
-    # http file: custom columns
-    if http_file:
-        http_cols = ['id', 'date', 'user', 'pc', 'url']
-        http_counts = pd.read_csv(http_file, header=None, names=http_cols)['user'].value_counts().rename('http_count')
-    else:
-        http_counts = pd.Series(dtype=int)
-    
-    # merge together
-    features = pd.concat([logon_counts, http_counts, device_counts], axis=1).fillna(0).astype(int)
+    # http file: custom columns; logon and device: default headers
+    http_cols = ['id', 'date', 'user', 'pc', 'url']
+
+    # the three logs are independent and pyarrow releases the GIL while parsing,
+    # so read them concurrently
+    with ThreadPoolExecutor(max_workers=3) as ex:
+        logon_fut = ex.submit(load_and_aggregate, logon_file, out_name='logon_count')
+        http_fut = ex.submit(load_and_aggregate, http_file, header=None, names=http_cols, out_name='http_count')
+        device_fut = ex.submit(load_and_aggregate, device_file, out_name='device_count')
+    logon_counts, http_counts, device_counts = logon_fut.result(), http_fut.result(), device_fut.result()
+
+    # merge together: scatter each Series into one preallocated int32 matrix
+    # over the union of users, so there is no NaN fill or float round-trip
+    users = logon_counts.index.union(http_counts.index).union(device_counts.index)
+    out = np.zeros((len(users), len(COUNT_COLUMNS)), dtype=np.int32)
+    for col, counts in enumerate([logon_counts, http_counts, device_counts]):
+        out[users.get_indexer(counts.index), col] = counts.to_numpy()
+    features = pd.DataFrame(out, index=users, columns=COUNT_COLUMNS)
+    features.index.name = "user"
+    return features
+
+def default_features_path():
+    # Prefer the Parquet written by main(); fall back to the CSV shipped with the repo
+    return FEATURES_PARQUET if os.path.exists(FEATURES_PARQUET) else FEATURES_CSV
+
+def read_features(path, with_users=True):
+    if not path.endswith('.parquet'):
+        # Declared dtypes skip type inference and match the int32 Parquet output
+        return pd.read_csv(path, index_col=0, engine='pyarrow', dtype={col: 'int32' for col in COUNT_COLUMNS})
+    features = pd.read_parquet(path)
+    if with_users:
+        features.index = read_users(path)
     return features
 
+def read_users(features_path):
+    # users.parquet sits next to features.parquet, one row per feature row
+    users_path = os.path.join(os.path.dirname(features_path), 'users.parquet')
+    return pd.Index(pd.read_parquet(users_path)['user'], name='user')
+
+def save_features(features):
+    # Parquet keeps the int32 dtypes and reloads far faster than CSV; the counts
+    # are stored with a RangeIndex and the user labels separately, since
+    # training never needs them
+    features = features.reset_index()
+    features[COUNT_COLUMNS].astype('int32').to_parquet(FEATURES_PARQUET, compression='zstd')
+    features[['user']].to_parquet(USERS_PARQUET, compression='zstd')
+
 def main():
+    parser = argparse.ArgumentParser(description="Aggregate per-user counts from the r1 logs.")
+    parser.add_argument('--verbose', action='store_true', help="print a sample of the aggregated features")
+    args = parser.parse_args()
+
     base_dir = os.path.dirname(__file__)
     logon_path = os.path.join(base_dir, '..', 'r1', 'logon.csv')
     http_path = os.path.join(base_dir, '..', 'r1', 'http.csv')
     device_path = os.path.join(base_dir, '..', 'r1', 'device.csv')
 
     features = run_feature_engineering_from_files(logon_path, http_path, device_path)
-    print("Sample of aggregated features:")
-    print(features.head())
+    if args.verbose:
+        print("Sample of aggregated features:")
+        print(features.head())
 
-    features_path = os.path.join(base_dir, '..', 'features.csv')
-    features.to_csv(features_path)
-    print(f"\nFeatures saved to {features_path}")
+    save_features(features)
+    print(f"\nFeatures saved to {FEATURES_PARQUET}")
 
 if __name__ == "__main__":
     main()
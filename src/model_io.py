@@ -0,0 +1,20 @@
+import joblib
+import os
+
+try:
+    import lz4  # noqa: F401
+    # LZ4 compresses the tree arrays faster than they would be written raw
+    COMPRESS = ('lz4', 3)
+except ImportError:
+    COMPRESS = ('zlib', 3)
+
+# Model artifact in model_store at the project root
+MODEL_PATH = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'model_store', 'iforest_model.joblib'))
+
+def load_model(path=MODEL_PATH):
+    return joblib.load(path)
+
+def save_model(model, path=MODEL_PATH):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    joblib.dump(model, path, compress=COMPRESS)
+    return path
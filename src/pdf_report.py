@@ -0,0 +1,26 @@
+import io
+import pandas as pd
+from reportlab.lib import colors
+from reportlab.lib.pagesizes import letter
+from reportlab.lib.styles import getSampleStyleSheet
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Table, TableStyle
+from feature_engineer import COUNT_COLUMNS
+
+HEADERS = ["User", "logon_count", "http_count", "device_count", "status"]
+COL_WIDTHS = [150, 79, 79, 79, 79]
+
+# Built once and shared by every report
+TITLE_STYLE = getSampleStyleSheet()['Title']
+TABLE_STYLE = TableStyle([
+    ('GRID', (0, 0), (-1, -1), 0.5, colors.black),
+    ('FONTNAME', (0, 0), (-1, -1), 'Helvetica'),
+])
+
+def generate_pdf(df: pd.DataFrame) -> bytes:
+    buf = io.BytesIO()
+    # Table rows (first 50 rows), stringified in one vectorized pass
+    rows = df.head(50)[COUNT_COLUMNS + ['status']].reset_index().astype(str).values.tolist()
+    table = Table([HEADERS] + rows, colWidths=COL_WIDTHS, style=TABLE_STYLE, repeatRows=1)
+    title = Paragraph("Insider Threat Detection Report", TITLE_STYLE)
+    SimpleDocTemplate(buf, pagesize=letter).build([title, table])
+    return buf.getvalue()
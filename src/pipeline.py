@@ -0,0 +1,38 @@
+import argparse
+import numpy as np
+import os
+from feature_engineer import COUNT_COLUMNS, FEATURES_CSV, FEATURES_PARQUET, ROOT_DIR, run_feature_engineering_from_files, save_features
+from model_io import save_model
+from train_model import anomaly_sample, train
+
+def main():
+    parser = argparse.ArgumentParser(description="Engineer features from the r1 logs and train the model in one process.")
+    parser.add_argument('--emit-csv', action='store_true', help="also write the features to features.csv")
+    parser.add_argument('--verbose', action='store_true', help="print sample anomalous users")
+    args = parser.parse_args()
+
+    logon_path = os.path.join(ROOT_DIR, 'r1', 'logon.csv')
+    http_path = os.path.join(ROOT_DIR, 'r1', 'http.csv')
+    device_path = os.path.join(ROOT_DIR, 'r1', 'device.csv')
+
+    # Hand the features straight to the model instead of reading them back from
+    # disk; they are still saved so the dashboard matches the retrained model
+    features = run_feature_engineering_from_files(logon_path, http_path, device_path)
+    save_features(features)
+    print(f"Features saved to {FEATURES_PARQUET}")
+    if args.emit_csv:
+        features.to_csv(FEATURES_CSV)
+        print(f"Features saved to {FEATURES_CSV}")
+
+    X = features[COUNT_COLUMNS].to_numpy(dtype=np.float32)
+    model = train(X)
+    preds = model.predict(X)
+
+    model_store_path = save_model(model)
+    print(f"Model trained and saved to {model_store_path}")
+    if args.verbose:
+        print("\nSample predictions (anomaly = -1):")
+        print(anomaly_sample(features, preds))
+
+if __name__ == "__main__":
+    main()
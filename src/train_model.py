@@ -1,34 +1,49 @@
-import pandas as pd
+import argparse
+import numpy as np
 from sklearn.ensemble import IsolationForest
-import joblib
-import os
+from feature_engineer import default_features_path, read_features, read_users
+from model_io import save_model
+
+def train(X):
+    # Initialize Isolation Forest; trees are independent, so build them on all cores
+    model = IsolationForest(n_estimators=100, contamination=0.05, random_state=42, n_jobs=-1)
+    model.fit(X)
+    return model
+
+def anomaly_sample(features, preds, users=None, n=5):
+    # Take the first anomalous rows by position rather than copying a filtered frame
+    rows = np.flatnonzero(preds == -1)[:n]
+    sample = features.iloc[rows].assign(anomaly=-1)
+    if users is not None:
+        sample.index = users[rows]
+    return sample
 
 def main():
-    # Get absolute path to features.csv in project root
-    base_dir = os.path.dirname(__file__)
-    features_path = os.path.join(base_dir, '..', 'features.csv')
+    parser = argparse.ArgumentParser(description="Train the Isolation Forest on the engineered features.")
+    parser.add_argument('--verbose', action='store_true', help="print sample anomalous users")
+    args = parser.parse_args()
 
-    # Load features
-    features = pd.read_csv(features_path, index_col=0)
+    # Load features (features.parquet in project root, else features.csv);
+    # user labels are only needed for the verbose sample
+    features_path = default_features_path()
+    features = read_features(features_path, with_users=False)
 
-    # Initialize Isolation Forest
-    model = IsolationForest(n_estimators=100, contamination=0.05, random_state=42)
-
-    # Train model on features
-    model.fit(features)
+    # Train on a float32 matrix, the dtype the trees use internally, so
+    # fit and predict share one conversion instead of each copying to float64
+    X = features.to_numpy(dtype=np.float32)
+    model = train(X)
 
     # Predict anomalies: -1 = anomaly, 1 = normal
-    preds = model.predict(features)
-    features['anomaly'] = preds
+    preds = model.predict(X)
 
     # Save the model in model_store
-    model_store_path = os.path.join(base_dir, '..', 'model_store', 'iforest_model.joblib')
-    os.makedirs(os.path.dirname(model_store_path), exist_ok=True)
-    joblib.dump(model, model_store_path)
+    model_store_path = save_model(model)
 
     print(f"Model trained and saved to {model_store_path}")
-    print("\nSample predictions (anomaly = -1):")
-    print(features[features['anomaly'] == -1].head())
+    if args.verbose:
+        users = read_users(features_path) if features_path.endswith('.parquet') else None
+        print("\nSample predictions (anomaly = -1):")
+        print(anomaly_sample(features, preds, users))
 
 if __name__ == "__main__":
     main()